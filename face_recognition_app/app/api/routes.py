@@ -1,7 +1,10 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Request
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Request, Response, Depends
+from fastapi.responses import PlainTextResponse
+import math
 import resource
 from app.services.face_recognition import face_service
 from app.services.vector_db import vector_db
+from app.services.profiler import profiler, ProfilerBusyError
 from app.schemas.face import FaceRegisterResponse, FaceSearchResponse, FaceMatch, MessageResponse
 from app.middleware.stats import request_tracker
 import numpy as np
@@ -51,17 +54,19 @@ async def register_face(
     return FaceRegisterResponse(id=face_id, message="Face registered successfully", face_image=face_b64)
 
 @router.post("/recognize", response_model=FaceSearchResponse)
-async def recognize_face(file: UploadFile = File(...)):
+async def recognize_face(request: Request, response: Response, file: UploadFile = File(...)):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
     content = await file.read()
-    embedding, _ = face_service.analyze_face(content)
-    
-    if embedding is None:
-        raise HTTPException(status_code=400, detail="No face detected in the image")
-    
-    results = vector_db.search_face(embedding)
+    # Opt-in cProfile trace (profiling header); a no-op context otherwise
+    with profiler.profile_request(request, response):
+        embedding, _ = face_service.analyze_face(content)
+        
+        if embedding is None:
+            raise HTTPException(status_code=400, detail="No face detected in the image")
+        
+        results = vector_db.search_face(embedding)
     
     matches = []
     for result in results:
@@ -110,3 +115,56 @@ async def get_system_stats(request: Request):
         "db_segments": db_segments,
         "api_performance": api_stats
     }
+
+def require_profiling():
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@router.get("/admin/profile/cpu", response_class=PlainTextResponse, dependencies=[Depends(require_profiling)])
+def profile_cpu(duration: float = 10.0, interval: float = 0.005, idle: bool = False):
+    # Sync endpoint: runs in the threadpool so the event loop keeps serving (and gets sampled)
+    headers = profiler.worker_headers()
+    if not (math.isfinite(duration) and math.isfinite(interval)) or duration <= 0 or interval <= 0:
+        raise HTTPException(status_code=400, detail="Duration and interval must be positive finite numbers", headers=headers)
+    try:
+        collapsed = profiler.sample_cpu(duration, interval, idle=idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers=headers)
+
+    headers["Content-Disposition"] = "attachment; filename=cpu_profile.collapsed"
+    return PlainTextResponse(collapsed, headers=headers)
+
+@router.get("/admin/profile/requests/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_profiling)])
+def get_request_profile(profile_id: str):
+    headers = profiler.worker_headers()
+    trace = profiler.get_request_profile(profile_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found", headers=headers)
+    return PlainTextResponse(trace, headers=headers)
+
+@router.post("/admin/memory/start", response_model=MessageResponse, dependencies=[Depends(require_profiling)])
+def start_memory_tracing(response: Response):
+    response.headers.update(profiler.worker_headers())
+    profiler.start_memory_tracing()
+    return MessageResponse(message="Memory tracing started")
+
+@router.get("/admin/memory/snapshot", dependencies=[Depends(require_profiling)])
+def get_memory_snapshot(response: Response, limit: int = 20, filename: str = None, key_type: str = "lineno"):
+    headers = profiler.worker_headers()
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be a positive integer", headers=headers)
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key_type must be one of lineno, filename, traceback", headers=headers)
+    try:
+        snapshot = profiler.memory_snapshot(limit=limit, filename_filter=filename, key_type=key_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers=headers)
+
+    response.headers.update(headers)
+    return snapshot
+
+@router.post("/admin/memory/stop", response_model=MessageResponse, dependencies=[Depends(require_profiling)])
+def stop_memory_tracing(response: Response):
+    response.headers.update(profiler.worker_headers())
+    profiler.stop_memory_tracing()
+    return MessageResponse(message="Memory tracing stopped")
@@ -14,4 +14,12 @@ class Settings:
     COLLECTION_NAME: str = "faces"
     VECTOR_SIZE: int = 512
 
+    # Profiling Settings (admin endpoints are hidden unless enabled)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_HEADER: str = "X-Profile"
+    PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "") # Shared secret the profile header must carry; unset disables per-request profiling
+    PROFILE_MAX_DURATION: float = 60.0 # Upper bound for a CPU sampling run, in seconds
+    PROFILE_HISTORY_SIZE: int = 20 # Number of per-request cProfile traces kept in memory
+    TRACEMALLOC_FRAMES: int = 10
+
 settings = Settings()
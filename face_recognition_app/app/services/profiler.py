@@ -0,0 +1,191 @@
+import cProfile
+import hmac
+import io
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from app.core.config import settings
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+# Python-level leaf frames of threads parked on a lock, selector or queue (idle, not on CPU)
+IDLE_LEAF_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+class ProfilerService:
+    def __init__(self):
+        self.enabled = settings.PROFILING_ENABLED
+        self._cpu_lock = threading.Lock()
+        self._memory_baseline = None
+        self._request_profiles = OrderedDict()
+        self._request_lock = threading.Lock()
+
+    @staticmethod
+    def worker_headers() -> dict:
+        # Traces and tracemalloc state are per process; tells the caller which worker answered
+        return {"X-Profile-Pid": str(os.getpid())}
+
+    # --- CPU sampling ---
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        code = frame.f_code
+        return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAF_FRAMES
+
+    @staticmethod
+    def _collapse_frame(frame) -> str:
+        # Walk from the leaf up, then reverse so the root comes first (flamegraph order)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample_cpu(self, duration: float, interval: float = 0.005, idle: bool = False) -> str:
+        """Samples the threads of this worker and returns collapsed stacks ("a;b;c count").
+
+        Threads parked on a lock, selector or queue are skipped unless `idle` is set,
+        in which case the result is a wall-clock profile of every thread.
+        """
+        if not math.isfinite(duration) or not math.isfinite(interval):
+            raise ValueError("duration and interval must be finite")
+        duration = min(max(duration, 0.0), settings.PROFILE_MAX_DURATION)
+        # Too small spins while holding the GIL, too large overshoots the deadline
+        interval = min(max(interval, 0.001), 1.0)
+        if not self._cpu_lock.acquire(blocking=False):
+            raise ProfilerBusyError("A CPU profile is already running")
+
+        try:
+            own_id = threading.get_ident()
+            stacks = Counter()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id and (idle or not self._is_idle(frame)):
+                        stacks[self._collapse_frame(frame)] += 1
+                time.sleep(max(min(interval, deadline - time.monotonic()), 0.0))
+        finally:
+            self._cpu_lock.release()
+
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    # --- Memory snapshots ---
+
+    def start_memory_tracing(self, frames: int = None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or settings.TRACEMALLOC_FRAMES)
+        self._memory_baseline = None
+
+    def stop_memory_tracing(self):
+        tracemalloc.stop()
+        self._memory_baseline = None
+
+    @staticmethod
+    def _format_stat(stat) -> dict:
+        # Frames are ordered oldest first, so the allocation site is the last one
+        frame = stat.traceback[-1]
+        return {
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 2),
+            "count": stat.count,
+            "traceback": stat.traceback.format(),
+        }
+
+    @staticmethod
+    def _format_diff(stat) -> dict:
+        frame = stat.traceback[-1]
+        return {
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_diff_kb": round(stat.size_diff / 1024, 2),
+            "count_diff": stat.count_diff,
+            "size_kb": round(stat.size / 1024, 2),
+            "traceback": stat.traceback.format(),
+        }
+
+    def memory_snapshot(self, limit: int = 20, filename_filter: str = None, key_type: str = "lineno") -> dict:
+        """Takes a snapshot and diffs it against the previous one, which it then replaces."""
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory tracing is not running")
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        if filename_filter:
+            # e.g. "*/app/services/*" to focus on decode / crop-encoding / payload paths
+            filters.append(tracemalloc.Filter(True, filename_filter, all_frames=True))
+        # The baseline is kept unfiltered so the filter can change between calls
+        raw_snapshot = tracemalloc.take_snapshot()
+        snapshot = raw_snapshot.filter_traces(filters)
+
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "traced_memory_kb": round(current / 1024, 2),
+            "peak_memory_kb": round(peak / 1024, 2),
+            "top_allocations": [self._format_stat(s) for s in snapshot.statistics(key_type)[:limit]],
+            "diff": None,
+        }
+        if self._memory_baseline is not None:
+            baseline = self._memory_baseline.filter_traces(filters)
+            diff = snapshot.compare_to(baseline, key_type)
+            result["diff"] = [self._format_diff(s) for s in diff[:limit]]
+
+        self._memory_baseline = raw_snapshot
+        return result
+
+    # --- Per-request cProfile ---
+
+    def profile_request(self, request, response):
+        """Context manager that records a cProfile trace when the profile header carries PROFILE_TOKEN.
+
+        Returns a no-op context when profiling is disabled so the hot path stays untouched.
+        """
+        if not self.enabled or not settings.PROFILE_TOKEN:
+            return nullcontext()
+        token = request.headers.get(settings.PROFILE_HEADER)
+        if not token or not hmac.compare_digest(token.encode(), settings.PROFILE_TOKEN.encode()):
+            return nullcontext()
+        return self._profiled(response)
+
+    @contextmanager
+    def _profiled(self, response):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+        # Only reached on success: error responses drop the injected headers, so the trace would be unreachable
+        response.headers[f"{settings.PROFILE_HEADER}-Id"] = self._store_profile(profile)
+        response.headers.update(self.worker_headers())
+
+    def _store_profile(self, profile: cProfile.Profile) -> str:
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(50)
+        profile_id = str(uuid.uuid4())
+        with self._request_lock:
+            self._request_profiles[profile_id] = out.getvalue()
+            while len(self._request_profiles) > settings.PROFILE_HISTORY_SIZE:
+                self._request_profiles.popitem(last=False)
+        return profile_id
+
+    def get_request_profile(self, profile_id: str):
+        with self._request_lock:
+            return self._request_profiles.get(profile_id)
+
+profiler = ProfilerService()
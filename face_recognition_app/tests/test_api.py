@@ -1,10 +1,12 @@
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 import numpy as np
+import os
 import pytest
 from main import app # Import app instead of router
 from app.services.face_recognition import face_service
 from app.services.vector_db import vector_db
+from app.services.profiler import ProfilerBusyError
 
 # Create a TestClient instance using the full app
 client = TestClient(app)
@@ -178,3 +180,102 @@ def test_get_system_stats(mock_vector_db):
         assert json_response["total_face_vectors"] == 100
         assert json_response["db_segments"] == 2
         assert json_response["api_performance"]["/api/v1/test"]["total_requests"] == 10
+
+@pytest.fixture
+def profiling_enabled():
+    with patch("app.api.routes.profiler.enabled", True), \
+         patch("app.services.profiler.settings.PROFILE_TOKEN", "secret"):
+        yield
+
+@pytest.fixture
+def recognize_upload(mock_face_service, mock_vector_db):
+    # A /recognize call that finds a face but no matches
+    mock_face_service.analyze_face.return_value = (np.zeros(512), "querybase64")
+    mock_vector_db.search_face.return_value = []
+    return {"file": ("test.jpg", b"fake-image-content", "image/jpeg")}
+
+def test_profiling_endpoints_hidden_when_disabled():
+    with patch("app.api.routes.profiler.enabled", False):
+        assert client.get("/api/v1/admin/profile/cpu?duration=0.01").status_code == 404
+        assert client.post("/api/v1/admin/memory/start").status_code == 404
+        assert client.get("/api/v1/admin/memory/snapshot").status_code == 404
+
+def test_profile_cpu_returns_collapsed_stacks(profiling_enabled):
+    response = client.get("/api/v1/admin/profile/cpu?duration=0.05&interval=0.001")
+
+    assert response.status_code == 200
+    assert "cpu_profile.collapsed" in response.headers["content-disposition"]
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+    for line in response.text.strip().splitlines():
+        assert line.rsplit(" ", 1)[1].isdigit()
+
+def test_profile_cpu_rejects_non_finite_values(profiling_enabled):
+    assert client.get("/api/v1/admin/profile/cpu?duration=0.05&interval=nan").status_code == 400
+    assert client.get("/api/v1/admin/profile/cpu?duration=inf").status_code == 400
+
+def test_profile_cpu_concurrent_run(profiling_enabled):
+    with patch("app.api.routes.profiler.sample_cpu", side_effect=ProfilerBusyError("A CPU profile is already running")):
+        response = client.get("/api/v1/admin/profile/cpu?duration=0.05")
+
+    assert response.status_code == 409
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+
+def test_memory_snapshot_flow(profiling_enabled):
+    response = client.get("/api/v1/admin/memory/snapshot")
+    assert response.status_code == 409
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+
+    response = client.post("/api/v1/admin/memory/start")
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+    try:
+        first = client.get("/api/v1/admin/memory/snapshot?limit=5").json()
+        assert first["diff"] is None
+        second = client.get("/api/v1/admin/memory/snapshot?limit=5&key_type=traceback").json()
+        assert second["diff"] is not None
+    finally:
+        client.post("/api/v1/admin/memory/stop")
+
+def test_memory_snapshot_invalid_limit(profiling_enabled):
+    response = client.get("/api/v1/admin/memory/snapshot?limit=-1")
+
+    assert response.status_code == 400
+
+def test_recognize_face_with_profile_header(profiling_enabled, recognize_upload):
+    response = client.post("/api/v1/recognize", files=recognize_upload, headers={"X-Profile": "secret"})
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+    profile_id = response.headers["X-Profile-Id"]
+
+    trace = client.get(f"/api/v1/admin/profile/requests/{profile_id}")
+    assert trace.status_code == 200
+    assert "function calls" in trace.text
+
+def test_recognize_face_profile_header_ignored_when_disabled(profiling_enabled, recognize_upload):
+    with patch("app.api.routes.profiler.enabled", False):
+        response = client.post("/api/v1/recognize", files=recognize_upload, headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+def test_recognize_face_profile_header_requires_token(profiling_enabled, recognize_upload):
+    response = client.post("/api/v1/recognize", files=recognize_upload, headers={"X-Profile": "1"})
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+def test_recognize_face_no_face_with_profile_header(profiling_enabled, recognize_upload, mock_face_service):
+    mock_face_service.analyze_face.return_value = (None, None)
+
+    with patch("app.api.routes.profiler._store_profile") as mock_store:
+        response = client.post("/api/v1/recognize", files=recognize_upload, headers={"X-Profile": "secret"})
+
+    assert response.status_code == 400
+    assert "X-Profile-Id" not in response.headers
+    mock_store.assert_not_called()
+
+def test_get_request_profile_not_found(profiling_enabled):
+    response = client.get("/api/v1/admin/profile/requests/unknown")
+
+    assert response.status_code == 404
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+import pytest
+from app.services.profiler import ProfilerService, ProfilerBusyError
+
+def _busy_loop(stop_event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+def test_sample_cpu_returns_collapsed_stacks():
+    service = ProfilerService()
+    stop_event = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop_event,))
+    worker.start()
+    try:
+        collapsed = service.sample_cpu(duration=0.1, interval=0.001)
+    finally:
+        stop_event.set()
+        worker.join()
+
+    lines = collapsed.strip().splitlines()
+    assert lines
+    # Every line is "frame;frame;... count"
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert stack
+        assert int(count) > 0
+    assert any("_busy_loop" in line for line in lines)
+
+def test_sample_cpu_large_interval_respects_duration():
+    service = ProfilerService()
+    start = time.monotonic()
+    service.sample_cpu(duration=0.05, interval=100000)
+    assert time.monotonic() - start < 1.0
+    # The lock is released, so a follow-up run is not rejected
+    service.sample_cpu(duration=0.01)
+
+def test_sample_cpu_skips_idle_threads_by_default():
+    service = ProfilerService()
+    stop_event = threading.Event()
+    waiter = threading.Thread(target=stop_event.wait)
+    waiter.start()
+    try:
+        busy = service.sample_cpu(duration=0.05, interval=0.001)
+        wall_clock = service.sample_cpu(duration=0.05, interval=0.001, idle=True)
+    finally:
+        stop_event.set()
+        waiter.join()
+
+    def leaves(collapsed):
+        return [line.rsplit(" ", 1)[0].split(";")[-1] for line in collapsed.strip().splitlines()]
+
+    assert not any(leaf.startswith("wait (") for leaf in leaves(busy))
+    assert any(leaf.startswith("wait (") for leaf in leaves(wall_clock))
+
+def test_sample_cpu_rejects_non_finite_values():
+    service = ProfilerService()
+    with pytest.raises(ValueError):
+        service.sample_cpu(duration=0.05, interval=float("nan"))
+    with pytest.raises(ValueError):
+        service.sample_cpu(duration=float("nan"))
+    # The lock is not left held by the rejected calls
+    service.sample_cpu(duration=0.01)
+
+def test_sample_cpu_rejects_concurrent_runs():
+    service = ProfilerService()
+    service._cpu_lock.acquire()
+    try:
+        with pytest.raises(ProfilerBusyError):
+            service.sample_cpu(duration=0.01)
+    finally:
+        service._cpu_lock.release()
+
+def test_memory_snapshot_diffs_against_previous():
+    service = ProfilerService()
+    service.start_memory_tracing()
+    try:
+        first = service.memory_snapshot(limit=5, filename_filter=__file__)
+        assert first["diff"] is None
+
+        retained = [bytearray(1024) for _ in range(100)]
+        second = service.memory_snapshot(limit=5, filename_filter=__file__)
+        assert len(second["top_allocations"]) <= 5
+        leaks = [d for d in second["diff"] if d["location"].startswith(__file__) and d["size_diff_kb"] > 0]
+        assert leaks
+        assert sum(d["size_diff_kb"] for d in leaks) >= len(retained)
+    finally:
+        service.stop_memory_tracing()
+
+def test_memory_snapshot_baseline_ignores_filter_changes():
+    service = ProfilerService()
+    service.start_memory_tracing()
+    try:
+        retained = [bytearray(1024) for _ in range(100)]
+        # A baseline taken with a filter matching nothing must not make the retained block look new
+        service.memory_snapshot(filename_filter="*/does-not-exist/*")
+        second = service.memory_snapshot(limit=50, filename_filter=__file__)
+        assert second["top_allocations"][0]["size_kb"] >= len(retained)
+        assert all(d["size_diff_kb"] < len(retained) / 2 for d in second["diff"])
+    finally:
+        service.stop_memory_tracing()
+
+def _allocate_nested():
+    return [bytearray(1024) for _ in range(100)]
+
+def test_memory_snapshot_traceback_location_is_allocation_site():
+    service = ProfilerService()
+    service.start_memory_tracing()
+    try:
+        retained = _allocate_nested()
+        snapshot = service.memory_snapshot(limit=1, filename_filter=__file__, key_type="traceback")
+    finally:
+        service.stop_memory_tracing()
+
+    allocation_line = _allocate_nested.__code__.co_firstlineno + 1
+    assert len(retained) == 100
+    assert snapshot["top_allocations"][0]["location"] == f"{__file__}:{allocation_line}"
+
+def test_memory_snapshot_rejects_invalid_limit():
+    service = ProfilerService()
+    with pytest.raises(ValueError):
+        service.memory_snapshot(limit=-1)
+
+def test_memory_snapshot_requires_tracing():
+    service = ProfilerService()
+    with pytest.raises(RuntimeError):
+        service.memory_snapshot()
+
+@pytest.fixture
+def profiling_service():
+    with patch("app.services.profiler.settings.PROFILE_TOKEN", "secret"):
+        service = ProfilerService()
+        service.enabled = True
+        yield service
+
+def _request_and_response(profile_header):
+    request = MagicMock()
+    request.headers = {"X-Profile": profile_header}
+    response = MagicMock()
+    response.headers = {}
+    return request, response
+
+def test_profile_request_is_noop_when_disabled(profiling_service):
+    profiling_service.enabled = False
+    request, response = _request_and_response("secret")
+
+    with profiling_service.profile_request(request, response):
+        sum(range(1000))
+
+    assert response.headers == {}
+
+def test_profile_request_records_trace(profiling_service):
+    request, response = _request_and_response("secret")
+
+    with profiling_service.profile_request(request, response):
+        sum(range(1000))
+
+    profile_id = response.headers["X-Profile-Id"]
+    assert response.headers["X-Profile-Pid"] == str(os.getpid())
+    assert "function calls" in profiling_service.get_request_profile(profile_id)
+
+def test_profile_request_requires_token(profiling_service):
+    request, response = _request_and_response("wrong")
+
+    with profiling_service.profile_request(request, response):
+        sum(range(1000))
+
+    assert response.headers == {}
+
+def test_profile_request_discards_trace_on_error(profiling_service):
+    request, response = _request_and_response("secret")
+
+    with pytest.raises(ValueError):
+        with profiling_service.profile_request(request, response):
+            raise ValueError("boom")
+
+    assert response.headers == {}
+    assert not profiling_service._request_profiles